@@ -4,8 +4,15 @@
 # (Final Version with Attractive HTML/CSS Pages)
 
 import os
-from flask import Flask, render_template_string
+import hmac
+import json
+from flask import Flask, request, redirect, Response, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import tracking
+from bulk_sync import BulkSyncError, iter_changes, iter_chunks
 
 # --- NEW: HTML Template for All Response Pages ---
 RESPONSE_TEMPLATE = """
@@ -105,9 +112,27 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'subscribers.db')
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Connection pool tuning for PostgreSQL (SQLite keeps SQLAlchemy's defaults).
+if DATABASE_URL and DATABASE_URL.startswith("postgresql"):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': True,
+    }
 db = SQLAlchemy(app)
 
 
+def dispose_engine_after_fork():
+    """Drops pooled connections inherited from the parent so each worker opens its own."""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+# Bearer token required by the bulk subscription API; the API is disabled when unset.
+CRM_API_TOKEN = os.environ.get('CRM_API_TOKEN')
+
+
 # --- 2. Database Model ---
 class Subscriber(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -115,15 +140,135 @@ class Subscriber(db.Model):
     subscribed = db.Column(db.Boolean, default=True, nullable=False)
 
 
+class EngagementCount(db.Model):
+    """Aggregated open/click counters per campaign and article ('' for opens)."""
+    id = db.Column(db.Integer, primary_key=True)
+    campaign = db.Column(db.String(64), nullable=False)
+    article = db.Column(db.String(16), nullable=False, default='')
+    event = db.Column(db.String(8), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.UniqueConstraint('campaign', 'article', 'event'),)
+
+
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def persist_engagement_counts(counts):
+    """Adds a batch of {(campaign, article, event): n} counters with one executemany upsert."""
+    rows = [{'campaign': campaign, 'article': article, 'event': event, 'count': n}
+            for (campaign, article, event), n in counts.items()]
+    with app.app_context():
+        stmt = _UPSERT_INSERTS[db.engine.dialect.name](EngagementCount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['campaign', 'article', 'event'],
+            set_={'count': EngagementCount.count + stmt.excluded['count']},
+        )
+        try:
+            db.session.execute(stmt, rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+event_recorder = tracking.EventRecorder(flush_callback=persist_engagement_counts)
+
+
+def apply_subscription_changes(chunk):
+    """Applies one chunk of (item, change) pairs with set-based statements in a single transaction."""
+    valid = [change for _, change in chunk if change]
+    emails = [email for email, _ in valid]
+    try:
+        existing = set(db.session.execute(
+            select(Subscriber.email).where(Subscriber.email.in_(emails))
+        ).scalars()) if emails else set()
+
+        to_subscribe = [email for email, subscribed in valid if subscribed and email in existing]
+        to_unsubscribe = [email for email, subscribed in valid if not subscribed and email in existing]
+        to_insert = [{'email': email, 'subscribed': True} for email, subscribed in valid if subscribed and email not in existing]
+
+        if to_subscribe:
+            db.session.execute(update(Subscriber).where(Subscriber.email.in_(to_subscribe)).values(subscribed=True))
+        if to_unsubscribe:
+            db.session.execute(update(Subscriber).where(Subscriber.email.in_(to_unsubscribe)).values(subscribed=False))
+        if to_insert:
+            db.session.execute(insert(Subscriber), to_insert)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Bulk subscription chunk of {len(chunk)} failed: {e}")
+        return [{'email': change[0] if change else None, 'status': 'error'} for _, change in chunk]
+
+    results = []
+    for item, change in chunk:
+        if not change:
+            email = item.get('email') if isinstance(item, dict) else None
+            results.append({'email': email, 'status': 'invalid'})
+            continue
+        email, subscribed = change
+        if subscribed:
+            status = 'resubscribed' if email in existing else 'subscribed'
+        else:
+            status = 'unsubscribed' if email in existing else 'not_found'
+        results.append({'email': email, 'status': status})
+    return results
+
+
 # --- 3. Web Routes (Updated with Attractive Templates) ---
-@app.route('/')
-def index():
-    context = {
+RESPONSE_PAGES = {
+    'index': {
         'title': "Neo Safe2Eat",
         'message_type': "info",
         'description': "This is the subscription management service for our weekly newsletter on food safety, quality & traceability."
-    }
-    return render_template_string(RESPONSE_TEMPLATE, **context)
+    },
+    'resubscribed': {
+        'title': "🎉 Welcome Back!",
+        'message_type': "success",
+        'description': "Thank you for re-subscribing. You'll continue to receive our weekly food safety updates."
+    },
+    'subscribed': {
+        'title': "✅ Subscription Successful!",
+        'message_type': "success",
+        'description': "Thank you for subscribing to the Neo Safe2Eat Newsletter! Keep an eye on your inbox."
+    },
+    'unsubscribed': {
+        'title': "✅ Unsubscribed",
+        'message_type': "info",
+        'description': "You have been successfully unsubscribed. We're sorry to see you go!"
+    },
+    'not_found': {
+        'title': "🤔 Already Unsubscribed",
+        'message_type': "warning",
+        'description': "Your email was not found in our subscriber list, so you are already unsubscribed."
+    },
+    'invalid_link': {
+        'title': "🤔 Link Not Recognised",
+        'message_type': "warning",
+        'description': "This newsletter link is invalid or has expired."
+    },
+}
+
+_response_template = app.jinja_env.from_string(RESPONSE_TEMPLATE)
+_rendered_pages = {}
+
+
+def preload_response_pages():
+    """Renders every response page once so workers forked after preload share them."""
+    for page in RESPONSE_PAGES:
+        render_response_page(page)
+
+
+def render_response_page(page):
+    """Returns the rendered HTML for one of RESPONSE_PAGES, rendering it on first use."""
+    html = _rendered_pages.get(page)
+    if html is None:
+        html = _rendered_pages[page] = _response_template.render(**RESPONSE_PAGES[page])
+    return html
+
+
+@app.route('/')
+def index():
+    return render_response_page('index')
 
 @app.route('/subscribe/<email>', methods=['GET'])
 def subscribe(email):
@@ -131,21 +276,11 @@ def subscribe(email):
     if subscriber:
         subscriber.subscribed = True
         db.session.commit()
-        context = {
-            'title': "🎉 Welcome Back!",
-            'message_type': "success",
-            'description': "Thank you for re-subscribing. You'll continue to receive our weekly food safety updates."
-        }
-    else:
-        new_subscriber = Subscriber(email=email, subscribed=True)
-        db.session.add(new_subscriber)
-        db.session.commit()
-        context = {
-            'title': "✅ Subscription Successful!",
-            'message_type': "success",
-            'description': "Thank you for subscribing to the Neo Safe2Eat Newsletter! Keep an eye on your inbox."
-        }
-    return render_template_string(RESPONSE_TEMPLATE, **context)
+        return render_response_page('resubscribed')
+    new_subscriber = Subscriber(email=email, subscribed=True)
+    db.session.add(new_subscriber)
+    db.session.commit()
+    return render_response_page('subscribed')
 
 @app.route('/unsubscribe/<email>', methods=['GET'])
 def unsubscribe(email):
@@ -153,18 +288,50 @@ def unsubscribe(email):
     if subscriber:
         subscriber.subscribed = False
         db.session.commit()
-        context = {
-            'title': "✅ Unsubscribed",
-            'message_type': "info",
-            'description': "You have been successfully unsubscribed. We're sorry to see you go!"
-        }
-    else:
-        context = {
-            'title': "🤔 Already Unsubscribed",
-            'message_type': "warning",
-            'description': "Your email was not found in our subscriber list, so you are already unsubscribed."
-        }
-    return render_template_string(RESPONSE_TEMPLATE, **context)
+        return render_response_page('unsubscribed')
+    return render_response_page('not_found')
+
+@app.route('/t/o/<campaign>/<recipient>.gif', methods=['GET'])
+def track_open(campaign, recipient):
+    if not tracking.tracking_secret():
+        return render_response_page('invalid_link'), 404
+    if not tracking.verify_open(campaign, recipient, request.args.get('s')):
+        return render_response_page('invalid_link'), 400
+    event_recorder.record(tracking.EVENT_OPEN, campaign, '', recipient)
+    return Response(tracking.PIXEL_GIF, mimetype='image/gif', headers={
+        'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+    })
+
+@app.route('/t/c/<campaign>/<article>/<recipient>', methods=['GET'])
+def track_click(campaign, article, recipient):
+    if not tracking.tracking_secret():
+        return render_response_page('invalid_link'), 404
+    url = request.args.get('u', '')
+    if not url or not tracking.verify_click(campaign, article, recipient, url, request.args.get('s')):
+        return render_response_page('invalid_link'), 400
+    event_recorder.record(tracking.EVENT_CLICK, campaign, article, recipient)
+    return redirect(url, code=302)
+
+@app.route('/api/subscribers/bulk', methods=['POST'])
+def bulk_update_subscribers():
+    """Applies a streamed JSON array or NDJSON body of {email, subscribed} changes.
+
+    Results are streamed back as NDJSON, one line per input item, in order.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    # Compare bytes: compare_digest rejects non-ASCII str, which would turn a bad header into a 500.
+    if (not CRM_API_TOKEN or scheme.lower() != 'bearer'
+            or not hmac.compare_digest(token.strip().encode(), CRM_API_TOKEN.encode())):
+        return jsonify({'error': 'unauthorized'}), 401
+
+    def generate():
+        try:
+            for chunk in iter_chunks(iter_changes(request.stream)):
+                yield ''.join(json.dumps(result) + '\n' for result in apply_subscription_changes(chunk))
+        except BulkSyncError as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
 # --- 4. Command Line Interface (CLI) for local DB setup ---
@@ -0,0 +1,252 @@
+# File: async_smtp.py
+# Description: Minimal SMTP client on asyncio streams (standard library only).
+#              Supports EHLO, STARTTLS, AUTH PLAIN/LOGIN and PIPELINING, plus a
+#              semaphore-bounded pool that reuses sessions across messages.
+
+import re
+import ssl
+import base64
+import socket
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+CRLF = b"\r\n"
+_EOL_RE = re.compile(r"(?:\r\n|\n|\r(?!\n))")
+_LEADING_DOT_RE = re.compile(r"(?m)^\.")
+
+
+class SMTPReplyError(Exception):
+    """Raised when the server answers a command with an unexpected reply code."""
+
+    def __init__(self, code, message, command=""):
+        super().__init__(f"{command} -> {code} {message}".strip())
+        self.code = code
+        self.message = message
+        self.command = command
+
+
+class SMTPNotSupportedError(Exception):
+    """Raised when the server does not advertise an extension the session requires."""
+
+
+def encode_message_data(message):
+    """Normalises line endings to CRLF and dot-stuffs a message for the DATA phase."""
+    data = _LEADING_DOT_RE.sub("..", _EOL_RE.sub("\r\n", message))
+    if not data.endswith("\r\n"):
+        data += "\r\n"
+    return data.encode("ascii") + b".\r\n"
+
+
+# --- 1. Single SMTP Session ---
+
+class AsyncSMTPConnection:
+    """One SMTP session over asyncio streams."""
+
+    def __init__(self, host, port, username=None, password=None, starttls=True,
+                 timeout=30, ssl_context=None, local_hostname=None, allow_plaintext_auth=False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_starttls = starttls
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.local_hostname = local_hostname or socket.gethostname()
+        self.allow_plaintext_auth = allow_plaintext_auth
+        self.tls = False
+        self.extensions = {}
+        self._reader = None
+        self._writer = None
+
+    async def connect(self):
+        """Opens the session: greeting, EHLO, optional STARTTLS and AUTH."""
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        await self._expect(220, "CONNECT")
+        await self.ehlo()
+        if self.use_starttls:
+            # Never fall back to plaintext: a stripped STARTTLS line would expose the credentials.
+            if "starttls" not in self.extensions:
+                raise SMTPNotSupportedError("STARTTLS extension not supported by server")
+            await self.starttls()
+        if self.username:
+            await self.login()
+
+    async def _read_reply(self):
+        """Reads one (possibly multi-line) reply. Returns (code, [lines])."""
+        lines = []
+        while True:
+            raw = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            if not raw:
+                raise ConnectionError("SMTP server closed the connection")
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            lines.append(line[4:])
+            if len(line) < 4 or line[3] != "-":
+                return int(line[:3]), lines
+
+    async def _expect(self, codes, command):
+        codes = (codes,) if isinstance(codes, int) else codes
+        code, lines = await self._read_reply()
+        if code not in codes:
+            raise SMTPReplyError(code, " ".join(lines), command)
+        return code, lines
+
+    async def _command(self, line, codes=250):
+        self._writer.write(line.encode("ascii") + CRLF)
+        await self._writer.drain()
+        return await self._expect(codes, line.split(" ", 1)[0])
+
+    async def ehlo(self):
+        """Sends EHLO and records the advertised extensions."""
+        _, lines = await self._command(f"EHLO {self.local_hostname}")
+        self.extensions = {}
+        for line in lines[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.lower()] = params
+        return self.extensions
+
+    async def starttls(self):
+        """Upgrades the session to TLS and repeats EHLO."""
+        await self._command("STARTTLS", 220)
+        context = self.ssl_context or ssl.create_default_context()
+        await self._writer.start_tls(context, server_hostname=self.host)
+        self.tls = True
+        await self.ehlo()
+
+    async def login(self):
+        """Authenticates with AUTH PLAIN, or AUTH LOGIN if PLAIN is not advertised.
+
+        Refuses to send credentials over an unencrypted session unless
+        allow_plaintext_auth was set.
+        """
+        if not self.tls and not self.allow_plaintext_auth:
+            raise SMTPNotSupportedError("Refusing AUTH over a plaintext session; enable STARTTLS")
+        if "auth" not in self.extensions:
+            raise SMTPNotSupportedError("AUTH extension not supported by server")
+        mechanisms = self.extensions["auth"].upper().split()
+        if "PLAIN" in mechanisms:
+            token = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+            await self._command(f"AUTH PLAIN {token}", 235)
+        elif "LOGIN" in mechanisms:
+            await self._command("AUTH LOGIN", 334)
+            await self._command(base64.b64encode(self.username.encode()).decode(), 334)
+            await self._command(base64.b64encode(self.password.encode()).decode(), 235)
+        else:
+            raise SMTPNotSupportedError(f"No supported AUTH mechanism in: {' '.join(mechanisms)}")
+
+    async def sendmail(self, from_addr, to_addrs, message):
+        """Sends one message. Returns {recipient: (code, text)} for refused recipients.
+
+        With PIPELINING, MAIL, every RCPT and DATA are written in one batch and
+        their replies read back in order; otherwise each waits for its reply.
+        Raises SMTPReplyError if the sender or all recipients are refused.
+        """
+        data = encode_message_data(message) if isinstance(message, str) else message
+        commands = [f"MAIL FROM:<{from_addr}>"] + [f"RCPT TO:<{rcpt}>" for rcpt in to_addrs] + ["DATA"]
+
+        replies = []
+        if "pipelining" in self.extensions:
+            self._writer.write(b"".join(c.encode("ascii") + CRLF for c in commands))
+            await self._writer.drain()
+            for _ in commands:
+                replies.append(await self._read_reply())
+        else:
+            for c in commands:
+                self._writer.write(c.encode("ascii") + CRLF)
+                await self._writer.drain()
+                replies.append(await self._read_reply())
+                if len(replies) == 1 and replies[0][0] != 250:
+                    break
+
+        mail_code, mail_lines = replies[0]
+        if mail_code != 250:
+            await self._abort_data(replies)
+            raise SMTPReplyError(mail_code, " ".join(mail_lines), "MAIL")
+
+        refused = {rcpt: (code, " ".join(lines))
+                   for rcpt, (code, lines) in zip(to_addrs, replies[1:-1]) if code not in (250, 251)}
+        data_code, data_lines = replies[-1]
+        if len(refused) == len(to_addrs):
+            await self._abort_data(replies)
+            code, text = next(iter(refused.values()))
+            raise SMTPReplyError(code, text, "RCPT")
+        if data_code != 354:
+            await self._command("RSET")
+            raise SMTPReplyError(data_code, " ".join(data_lines), "DATA")
+
+        self._writer.write(data)
+        await self._writer.drain()
+        await self._expect(250, "DATA")
+        return refused
+
+    async def _abort_data(self, replies):
+        """Cleans up after a refused transaction, closing an accepted DATA with an empty body."""
+        if len(replies) > 1 and replies[-1][0] == 354:
+            self._writer.write(b".\r\n")
+            await self._writer.drain()
+            await self._read_reply()
+        await self._command("RSET")
+
+    async def quit(self):
+        """Ends the session politely and closes the connection."""
+        try:
+            await self._command("QUIT", 221)
+        except (OSError, asyncio.TimeoutError, SMTPReplyError):
+            pass
+        self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+# --- 2. Connection Pool ---
+
+class AsyncSMTPPool:
+    """Bounds concurrent sends with a semaphore and reuses idle sessions.
+
+    At most `concurrency` messages are in flight, so at most that many
+    sessions are open at once.
+    """
+
+    def __init__(self, concurrency, **connection_kwargs):
+        self.concurrency = concurrency
+        self.connection_kwargs = connection_kwargs
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._idle = []
+
+    async def _connect(self):
+        connection = AsyncSMTPConnection(**self.connection_kwargs)
+        try:
+            await connection.connect()
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    async def open(self):
+        """Opens one session up front so an unreachable or misconfigured server fails fast."""
+        self._idle.append(await self._connect())
+
+    async def sendmail(self, from_addr, to_addrs, message):
+        async with self._semaphore:
+            connection = self._idle.pop() if self._idle else await self._connect()
+            try:
+                refused = await connection.sendmail(from_addr, to_addrs, message)
+            except SMTPReplyError:
+                # The session is still in a clean state after a refused transaction.
+                self._idle.append(connection)
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            self._idle.append(connection)
+            return refused
+
+    async def close(self):
+        """Sends QUIT on every idle session."""
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(connection.quit() for connection in idle))
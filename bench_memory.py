@@ -0,0 +1,273 @@
+# File: bench_memory.py
+# Description: Allocation and memory budget check for the per-recipient send
+#              path (build_recipient_html + send_newsletter_with_cc) through a
+#              real smtplib.SMTP session to a local sink. Exits non-zero and
+#              prints the top allocation sites when a budget is exceeded.
+#
+# Usage: python bench_memory.py [--messages 50000] [--margin 0.25] [--max-allocated-kib N] [--max-peak-kib N]
+#
+# The per-message budgets are checked with open/click tracking both on and off;
+# the steady-state run uses tracking on. Budgets are the values measured on
+# Python 3.11 with the current content plus BUDGET_MARGIN, so changes in content or stdlib within that margin pass while a
+# copy-size regression does not. Re-measure (--margin 0 prints raw numbers) and
+# update the MEASURED_* constants when the newsletter content changes materially.
+
+import os
+import sys
+import logging
+import smtplib
+import argparse
+import collections
+import socketserver
+import tracemalloc
+import multiprocessing
+
+os.environ.setdefault("EMAIL_ADDRESS", "newsletter@example.com")
+# Tracked links are only built when a secret is set; the value is read on each use.
+TRACKING_SECRET = os.environ.setdefault("TRACKING_SECRET", "bench-memory-secret")
+import subsnewsletter
+
+# Measured on Python 3.11.7 (smtplib to the local sink, one CC) as
+# (bytes allocated per message, peak bytes live per message) in KiB. Tracking adds a
+# click link per article (23), the open pixel and the rewritten HTML copy. With
+# the 25% margin the budgets are ~2981/634 KiB with tracking on and ~2452/592 KiB
+# with it off. An HTML body copy kept alive alongside the MIME message (~155 KiB,
+# 4 bytes per character because of emoji) exceeds either peak budget; a
+# short-lived copy adds the same to the allocated figure, so three to four of
+# them exceed that budget.
+MEASURED_KIB = {
+    "tracking on": (2385, 507),
+    "tracking off": (1962, 474),
+}
+BUDGET_MARGIN = 0.25
+# Allocation bursts at least this large are attributed to a site in failure reports.
+SITE_THRESHOLD = 8 * 1024
+
+
+# --- 1. Local SMTP Sink ---
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib.sendmail and discards the messages."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 sink ready")
+        for raw in self.rfile:
+            command = raw.strip().upper()
+            if command.startswith(b"EHLO"):
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif command.startswith(b"HELO"):
+                self.reply("250 sink")
+            elif command == b"DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                for line in self.rfile:
+                    if line == b".\r\n":
+                        break
+                self.reply("250 queued")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+def start_sink():
+    """Starts the sink in a child process so its allocations stay out of the traces."""
+    server = socketserver.TCPServer(("127.0.0.1", 0), SinkHandler)
+    process = multiprocessing.Process(target=server.serve_forever, daemon=True)
+    process.start()
+    port = server.server_address[1]
+    server.socket.close()
+    return process, port
+
+
+# --- 2. Measurement Helpers ---
+
+def rss_bytes():
+    """Returns the current resident set size of this process."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def make_sender(server, static_content, categorized_content, cc_recipients, subject):
+    def send_one(index):
+        email = f"subscriber{index}@example.com"
+        html_body, unsubscribe_link = subsnewsletter.build_recipient_html(email, static_content, categorized_content)
+        if not subsnewsletter.send_newsletter_with_cc(server, email, cc_recipients, subject, html_body, unsubscribe_link):
+            raise RuntimeError(f"send to {email} failed")
+
+    return send_one
+
+
+def measure_allocations(send_one, index, overhead_per_event=0.0):
+    """Sends one message and returns (bytes_allocated, peak_bytes, sites).
+
+    tracemalloc only reports live and peak memory, so cumulative allocation is
+    taken as the sum of the high-water increase between consecutive profiler
+    events (every Python and C call/return). Short-lived copies are counted
+    even though they are freed before the message is done. The hook's own
+    allocations are removed using overhead_per_event from calibrate_overhead().
+    """
+    sites = collections.Counter()
+    allocated = events = 0
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    last, high = start, start
+
+    def profile(frame, event, arg):
+        nonlocal allocated, events, last, high
+        events += 1
+        current, peak = tracemalloc.get_traced_memory()
+        grown = peak - last
+        if grown > 0:
+            allocated += grown
+            if grown >= SITE_THRESHOLD:
+                where = f"{frame.f_code.co_filename}:{frame.f_lineno} ({frame.f_code.co_name})"
+                if event == "c_return":
+                    where += f" -> {arg.__qualname__}"
+                sites[where] += grown
+        high = max(high, peak)
+        last = current
+        tracemalloc.reset_peak()
+
+    sys.setprofile(profile)
+    try:
+        send_one(index)
+    finally:
+        sys.setprofile(None)
+    return allocated - int(events * overhead_per_event), high - start, sites
+
+
+def calibrate_overhead(calls=20000):
+    """Returns the bytes the profiler hook itself appears to allocate per event."""
+    def idle(_):
+        values = ()
+        for _ in range(calls):
+            len(values)
+
+    allocated, _, _ = measure_allocations(idle, 0)
+    # Each len() call produces a c_call and a c_return event.
+    return allocated / (2 * calls)
+
+
+def report_sites(sites, limit):
+    print(f"  Top {limit} allocation sites (bytes allocated in bursts >= {SITE_THRESHOLD // 1024} KiB):")
+    for where, size in sites.most_common(limit):
+        print(f"    {size / 1024:8.1f} KiB  {where}")
+
+
+def report_snapshot_diff(before, after, limit):
+    """Prints the allocation sites that grew the most between two snapshots."""
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    print(f"  Top {limit} allocation sites:")
+    for stat in stats[:limit]:
+        print(f"    {stat}")
+
+
+# --- 3. Budget Checks ---
+
+def set_tracking(enabled):
+    if enabled:
+        os.environ["TRACKING_SECRET"] = TRACKING_SECRET
+    else:
+        os.environ.pop("TRACKING_SECRET", None)
+
+
+def check_per_message(send_one, samples, max_allocated, max_peak, top, label):
+    """Checks bytes allocated and peak bytes live for the worst of `samples` messages."""
+    # First sends fill module-level caches (regexes, charset tables); keep them out of the budget.
+    for index in range(10):
+        send_one(index)
+    tracemalloc.start()
+    overhead = calibrate_overhead()
+    worst_allocated = worst_peak = 0
+    worst_sites = collections.Counter()
+    for index in range(10, 10 + samples):
+        allocated, peak, sites = measure_allocations(send_one, index, overhead)
+        if allocated > worst_allocated:
+            worst_allocated, worst_sites = allocated, sites
+        worst_peak = max(worst_peak, peak)
+    tracemalloc.stop()
+
+    allocated_ok = worst_allocated <= max_allocated
+    peak_ok = worst_peak <= max_peak
+    print(f"{'PASS' if allocated_ok else 'FAIL'} bytes allocated per message, {label}: {worst_allocated / 1024:.1f} KiB "
+          f"(budget {max_allocated / 1024:.0f} KiB)")
+    print(f"{'PASS' if peak_ok else 'FAIL'} peak bytes live per message, {label}: {worst_peak / 1024:.1f} KiB "
+          f"(budget {max_peak / 1024:.0f} KiB)")
+    if not (allocated_ok and peak_ok):
+        report_sites(worst_sites, top)
+    return allocated_ok and peak_ok
+
+
+def check_steady_state(send_one, messages, warmup, max_growth, top):
+    """Sends `messages` messages and checks RSS growth after warm-up."""
+    for index in range(warmup):
+        send_one(index)
+    baseline = rss_bytes()
+    peak = baseline
+    for index in range(warmup, messages):
+        send_one(index)
+        if index % 1000 == 0:
+            peak = max(peak, rss_bytes())
+    peak = max(peak, rss_bytes())
+    growth = peak - baseline
+
+    ok = growth <= max_growth
+    print(f"{'PASS' if ok else 'FAIL'} steady-state RSS growth over {messages - warmup} messages: "
+          f"{growth / 2**20:.1f} MiB (baseline {baseline / 2**20:.1f} MiB, budget {max_growth / 2**20:.0f} MiB)")
+    if not ok:
+        # Trace a further window to find what keeps growing.
+        tracemalloc.start(25)
+        before = tracemalloc.take_snapshot()
+        for index in range(messages, messages + warmup):
+            send_one(index)
+        report_snapshot_diff(before, tracemalloc.take_snapshot(), top)
+        tracemalloc.stop()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check memory budgets of the per-recipient send path.")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--warmup", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=50, help="messages traced for the per-message budgets")
+    parser.add_argument("--margin", type=float, default=BUDGET_MARGIN)
+    parser.add_argument("--max-allocated-kib", type=float)
+    parser.add_argument("--max-peak-kib", type=float)
+    parser.add_argument("--max-rss-growth-mib", type=float, default=16)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    # Per-message success logging would dominate both time and allocations.
+    logging.getLogger(subsnewsletter.__name__).setLevel(logging.WARNING)
+
+    static_content = subsnewsletter.get_newsletter_content()
+    categorized_content = subsnewsletter.get_manual_news_articles()
+    sink, port = start_sink()
+    try:
+        with smtplib.SMTP("127.0.0.1", port, timeout=30) as server:
+            send_one = make_sender(server, static_content, categorized_content, ["cc@example.com"],
+                                   "Neo Safe2Eat Weekly Newsletter Volume 1 | Week 4")
+            ok = True
+            for tracking_on in (True, False):
+                label = "tracking on" if tracking_on else "tracking off"
+                measured_allocated_kib, measured_peak_kib = MEASURED_KIB[label]
+                max_allocated_kib = args.max_allocated_kib or measured_allocated_kib * (1 + args.margin)
+                max_peak_kib = args.max_peak_kib or measured_peak_kib * (1 + args.margin)
+                set_tracking(tracking_on)
+                ok = check_per_message(send_one, args.samples, max_allocated_kib * 1024, max_peak_kib * 1024,
+                                       args.top, label) and ok
+            set_tracking(True)
+            ok = check_steady_state(send_one, args.messages, args.warmup, args.max_rss_growth_mib * 2**20, args.top) and ok
+    finally:
+        sink.terminate()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# File: bench_serving.py
+# Description: Measures gunicorn cold start and peak requests per second for the
+#              subscription app across worker/thread counts, using the settings
+#              in gunicorn.conf.py.
+#
+# Usage: python bench_serving.py [--path /] [--duration 5] [--clients 16]
+
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+import http.client
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+PROFILES = [
+    # (workers, threads, preload)
+    (1, 1, False),
+    (1, 1, True),
+    (2, 1, True),
+    (1, 4, True),
+    (2, 4, False),
+    (2, 4, True),
+    (4, 4, True),
+]
+
+
+def wait_until_ready(port, deadline):
+    """Polls / until it answers 200. Returns seconds waited, or None on timeout."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.02)
+    return None
+
+
+def measure_rps(port, path, duration, clients):
+    """Drives the server with keep-alive clients and returns requests per second."""
+    counts = [0] * clients
+    stop = time.perf_counter() + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        while time.perf_counter() < stop:
+            try:
+                conn.request("GET", path)
+                conn.getresponse().read()
+                counts[index] += 1
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(counts) / duration
+
+
+def run_profile(workers, threads, preload, args, port):
+    env = dict(os.environ,
+               PORT=str(port),
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_PRELOAD=str(preload))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=basedir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        cold_start = wait_until_ready(port, deadline=30)
+        if cold_start is None:
+            return None, None
+        # Let the remaining workers finish booting before measuring throughput.
+        time.sleep(1)
+        return cold_start, measure_rps(port, args.path, args.duration, args.clients)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gunicorn serving profiles.")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'threads':>7} {'preload':>7} {'cold start':>11} {'req/s':>9}")
+    for workers, threads, preload in PROFILES:
+        cold_start, rps = run_profile(workers, threads, preload, args, args.port)
+        if cold_start is None:
+            print(f"{workers:>7} {threads:>7} {str(preload):>7} {'failed':>11}")
+            continue
+        print(f"{workers:>7} {threads:>7} {str(preload):>7} {cold_start * 1000:>9.0f}ms {rps:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# File: bulk_sync.py
+# Description: Streaming parser and chunking helpers for the bulk
+#              subscribe/unsubscribe API used by the CRM sync.
+
+import json
+import codecs
+import itertools
+
+READ_SIZE = 64 * 1024
+CHUNK_SIZE = 1000
+# Largest single array element or NDJSON line buffered before giving up.
+MAX_ITEM_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+# Characters that can continue a number, so a number ending at one may be cut short.
+_NUMBER_CHARS = frozenset(".eE+-0123456789")
+
+
+class BulkSyncError(ValueError):
+    """Raised when the request body is not a JSON array or NDJSON stream of objects."""
+
+
+# --- 1. Streaming Parsing ---
+
+def _read_text(stream):
+    """Yields decoded text pieces from a binary stream."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            data = stream.read(READ_SIZE)
+            if not data:
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+                return
+            yield decoder.decode(data)
+    except UnicodeDecodeError:
+        raise BulkSyncError("Request body is not valid UTF-8.") from None
+
+
+def iter_changes(stream):
+    """Yields change objects from a streamed JSON array or NDJSON body.
+
+    The format is sniffed from the first non-whitespace character: '[' means
+    a JSON array, anything else is treated as one JSON object per line.
+    Unparsable NDJSON lines are yielded as None so they report as invalid.
+    """
+    pieces = _read_text(stream)
+    head = ""
+    for piece in pieces:
+        head = (head + piece).lstrip()
+        if head:
+            break
+    if not head:
+        return
+    pieces = itertools.chain([head], pieces)
+    if head[0] == "[":
+        yield from _iter_array(pieces)
+    else:
+        yield from _iter_ndjson(pieces)
+
+
+def _parse_line(line):
+    line = line.strip()
+    if not line:
+        return
+    try:
+        yield json.loads(line)
+    except json.JSONDecodeError:
+        yield None
+
+
+def _iter_ndjson(pieces):
+    pending = ""
+    for piece in pieces:
+        lines = (pending + piece).split("\n")
+        pending = lines.pop()
+        if len(pending) > MAX_ITEM_SIZE:
+            raise BulkSyncError(f"NDJSON line longer than {MAX_ITEM_SIZE} characters.")
+        for line in lines:
+            yield from _parse_line(line)
+    yield from _parse_line(pending)
+
+
+def _iter_array(pieces):
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        piece = next(pieces, None)
+        if piece is None:
+            eof = True
+        else:
+            buffer = buffer[pos:] + piece
+            pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def next_char():
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise BulkSyncError("Unterminated JSON array.")
+        return buffer[pos]
+
+    fill()
+    pos = 1  # the sniffed '['
+    if next_char() == "]":
+        pos += 1
+    else:
+        while True:
+            while True:
+                try:
+                    obj, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if eof or len(buffer) - pos > MAX_ITEM_SIZE:
+                        raise BulkSyncError(f"Invalid JSON array element near offset {e.pos - pos}.") from None
+                    fill()
+                    continue
+                # A number or literal cut off at a read boundary may still parse, either
+                # up to the end of the buffer ("12") or up to a partial fraction or
+                # exponent that does not ("12." or "12e"); read more before accepting it.
+                if (not eof and not isinstance(obj, (dict, list, str))
+                        and (end == len(buffer) or buffer[end] in _NUMBER_CHARS)):
+                    fill()
+                    continue
+                break
+            pos = end
+            yield obj
+
+            separator = next_char()
+            pos += 1
+            if separator == "]":
+                break
+            if separator != ",":
+                raise BulkSyncError("Expected ',' or ']' after array element.")
+            skip_whitespace()
+
+    skip_whitespace()
+    if pos < len(buffer):
+        raise BulkSyncError("Unexpected data after JSON array.")
+
+
+# --- 2. Validation and Chunking ---
+
+def normalize_change(item):
+    """Returns (email, subscribed) for a valid change, or None."""
+    if not isinstance(item, dict):
+        return None
+    email, subscribed = item.get("email"), item.get("subscribed")
+    if not isinstance(email, str) or not isinstance(subscribed, bool):
+        return None
+    email = email.strip()
+    if "@" not in email or len(email) > 120:
+        return None
+    return email, subscribed
+
+
+def iter_chunks(changes, size=CHUNK_SIZE):
+    """Groups changes into chunks of at most `size` with no repeated email.
+
+    A repeated email closes the current chunk so changes stay applied in order.
+    """
+    chunk, seen = [], set()
+    for item in changes:
+        change = normalize_change(item)
+        email = change[0] if change else None
+        if len(chunk) >= size or (email is not None and email in seen):
+            yield chunk
+            chunk, seen = [], set()
+        chunk.append((item, change))
+        if email is not None:
+            seen.add(email)
+    if chunk:
+        yield chunk
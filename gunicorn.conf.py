@@ -0,0 +1,49 @@
+# File: gunicorn.conf.py
+# Description: Production serving profile for the subscription app.
+#              Gunicorn loads this file automatically from the working
+#              directory: `gunicorn app:app`.
+
+import os
+import multiprocessing
+
+# --- 1. Server Socket ---
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# --- 2. Worker Processes ---
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# Threaded workers already overlap I/O, so one per CPU; sync workers use the usual 2 * CPUs + 1.
+default_workers = multiprocessing.cpu_count() if threads > 1 else multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get('GUNICORN_WORKERS', default_workers))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+# Import the app (and run create_all) once in the master; workers inherit it on fork.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+# Each worker thread may hold one connection, plus one for the tracking flusher thread;
+# size the pool to match unless overridden and keep the overflow small. The most
+# PostgreSQL connections the server opens is then
+#   workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) = workers * (threads + 3),
+# e.g. 28 on 4 CPUs with the default 4 threads (PostgreSQL allows 100 by default).
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 1))
+os.environ.setdefault('DB_MAX_OVERFLOW', '2')
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+# --- 3. Server Hooks ---
+def when_ready(server):
+    """Renders the response pages in the master so preloaded workers share them."""
+    if preload_app:
+        from app import preload_response_pages
+        preload_response_pages()
+
+
+def post_fork(server, worker):
+    """Gives every worker its own database connections."""
+    from app import dispose_engine_after_fork
+    dispose_engine_after_fork()
@@ -1,17 +1,26 @@
 import os
+import re
 import time
+import asyncio
 import logging
 import smtplib
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formataddr
 from urllib.parse import quote
 from dotenv import load_dotenv
 
+# Load .env before the project imports, which read their settings at import time.
+load_dotenv()
+
 # NEW and CORRECT
 from app import db, Subscriber, app
+from tracking import tracking_secret, build_click_link, build_open_pixel_link
+from async_smtp import AsyncSMTPPool
 # --- 1. Configuration ---
-load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)  # Fixed typo here
 
@@ -21,6 +30,26 @@ APP_DOMAIN = os.getenv("APP_DOMAIN", "http://127.0.0.1:5000")
 SEND_NEWSLETTER = os.getenv("SEND_NEWSLETTER", "True").lower() == "true"
 TEST_RECIPIENT_EMAIL = os.getenv("TEST_RECIPIENT_EMAIL")
 CC_RECIPIENT_EMAIL = os.getenv("CC_RECIPIENT_EMAIL")  # Add this to your .env file
+CAMPAIGN_ID = os.getenv("CAMPAIGN_ID", "vol1-week4")
+TRACK_ENGAGEMENT = os.getenv("TRACK_ENGAGEMENT", "True").lower() == "true"
+# SMTP_HOST defaults to Gmail for sync sends; async mode requires it to be set (e.g. a local relay).
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "True").lower() == "true"
+# Credentials are only sent over STARTTLS unless this is explicitly enabled (e.g. a local relay).
+SMTP_ALLOW_PLAINTEXT_AUTH = os.getenv("SMTP_ALLOW_PLAINTEXT_AUTH", "False").lower() == "true"
+# "sync" sends over one smtplib session; "async" runs up to SMTP_CONCURRENCY asyncio sessions.
+SMTP_DELIVERY_MODE = os.getenv("SMTP_DELIVERY_MODE", "sync").lower()
+SMTP_CONCURRENCY = int(os.getenv("SMTP_CONCURRENCY", "100"))
+# Offline render: a path ending in .mbox writes one mbox file, anything else a directory of .eml files.
+OFFLINE_RENDER_PATH = os.getenv("OFFLINE_RENDER_PATH")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or os.cpu_count()
+# Recipients rendered per task, and tasks in flight per worker. Bounds the rendered
+# messages held in memory to workers * RENDER_TASKS_PER_WORKER * RENDER_BATCH_SIZE.
+RENDER_BATCH_SIZE = 16
+RENDER_TASKS_PER_WORKER = 2
+# From address used by offline renders when EMAIL_ADDRESS is not configured.
+OFFLINE_PLACEHOLDER_SENDER = "newsletter@example.invalid"
 
 # --- 2. Manual News Content ---
 
@@ -241,8 +270,13 @@ def get_all_recipients():
 
 # --- 5. HTML Generation ---
 
-def generate_html_content(static_content, categorized_content, unsubscribe_link, subscribe_link):
-    """Creates the HTML body from the main feature and categorized articles."""
+def generate_html_content(static_content, categorized_content, unsubscribe_link, subscribe_link,
+                          click_link=None, open_pixel_link=None):
+    """Creates the HTML body from the main feature and categorized articles.
+
+    click_link, if given, maps an article URL to its tracked redirect link;
+    open_pixel_link, if given, is embedded as the open-tracking image.
+    """
     
     def create_category_section(category_title, articles, category_color, category_icon):
         """Creates HTML for a category section with its articles."""
@@ -251,6 +285,7 @@ def generate_html_content(static_content, categorized_content, unsubscribe_link,
         
         articles_html = ""
         for article in articles:
+            article_link = click_link(article["url"]) if click_link else article["url"]
             articles_html += f"""
             <tr>
                 <td style="padding-bottom: 20px; border-bottom: 1px solid #1e2d3b; padding-top: 12px;">
@@ -259,7 +294,7 @@ def generate_html_content(static_content, categorized_content, unsubscribe_link,
                             <td valign="top">
                                 <h4 style="margin: 0 0 8px 0; font-family: Arial, sans-serif; font-size: 15px; line-height: 1.4; color: #FFFFFF; font-weight: bold;">{article["title"]}</h4>
                                 <p style="margin: 0 0 12px 0; font-family: Arial, sans-serif; font-size: 13px; line-height: 1.6; color: #bdc5d1;">{article["description"]}</p>
-                                <a href="{article["url"]}" target="_blank" style="color: #2CC3DA; text-decoration: none; font-weight: bold; font-size: 13px;">Read Article →</a>
+                                <a href="{article_link}" target="_blank" style="color: #2CC3DA; text-decoration: none; font-weight: bold; font-size: 13px;">Read Article →</a>
                             </td>
                         </tr>
                     </table>
@@ -326,6 +361,11 @@ def generate_html_content(static_content, categorized_content, unsubscribe_link,
 
     # Main feature content
     main_feature = static_content['main_feature']
+
+    # Open-tracking pixel
+    open_pixel_html = ""
+    if open_pixel_link:
+        open_pixel_html = f'<img src="{open_pixel_link}" width="1" height="1" alt="" style="display: block; border: 0; width: 1px; height: 1px;">'
     
     # Complete newsletter HTML
     return f"""
@@ -451,31 +491,56 @@ def generate_html_content(static_content, categorized_content, unsubscribe_link,
                 </td>
             </tr>
         </table>
+        {open_pixel_html}
     </body>
     </html>
     """
 
 
+def build_recipient_html(email, static_content, categorized_content):
+    """Builds the per-recipient links and HTML body. Returns (html_body, unsubscribe_link)."""
+    # Generate unsubscribe and subscribe links for each recipient
+    unsubscribe_link = f"{APP_DOMAIN}/unsubscribe/{quote(email, safe='')}"
+    subscribe_link = f"{APP_DOMAIN}/subscribe/{quote(email, safe='')}"
+
+    # Tracked article links and open pixel for this recipient
+    click_link = open_pixel_link = None
+    if TRACK_ENGAGEMENT and tracking_secret():
+        click_link = lambda url: build_click_link(APP_DOMAIN, CAMPAIGN_ID, email, url)
+        open_pixel_link = build_open_pixel_link(APP_DOMAIN, CAMPAIGN_ID, email)
+
+    html_body = generate_html_content(static_content, categorized_content, unsubscribe_link, subscribe_link,
+                                      click_link, open_pixel_link)
+    return html_body, unsubscribe_link
+
+
 # --- 6. Enhanced Email Sending Function ---
+def build_newsletter_message(recipient_email, cc_recipients, subject, html_body, unsubscribe_link,
+                             sender=None):
+    """Builds the MIME message sent to one recipient (from EMAIL_ADDRESS unless `sender` is given)."""
+    # Create email message
+    msg = MIMEMultipart("alternative")
+    msg["From"] = formataddr(("Neo Safe2Eat Weekly Newsletter", sender or EMAIL_ADDRESS))
+    msg["To"] = recipient_email
+
+    # Add CC recipients if any
+    if cc_recipients:
+        msg["Cc"] = ", ".join(cc_recipients)
+
+    msg["Subject"] = subject
+
+    # Add unsubscribe header
+    msg.add_header("List-Unsubscribe", f"<{unsubscribe_link}>")
+
+    # Attach HTML content
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+
 def send_newsletter_with_cc(server, recipient_email, cc_recipients, subject, html_body, unsubscribe_link):
     """Send newsletter to a recipient with CC functionality."""
     try:
-        # Create email message
-        msg = MIMEMultipart("alternative")
-        msg["From"] = formataddr(("Neo Safe2Eat Weekly Newsletter", EMAIL_ADDRESS))
-        msg["To"] = recipient_email
-        
-        # Add CC recipients if any
-        if cc_recipients:
-            msg["Cc"] = ", ".join(cc_recipients)
-        
-        msg["Subject"] = subject
-        
-        # Add unsubscribe header
-        msg.add_header("List-Unsubscribe", f"<{unsubscribe_link}>")
-
-        # Attach HTML content
-        msg.attach(MIMEText(html_body, "html"))
+        msg = build_newsletter_message(recipient_email, cc_recipients, subject, html_body, unsubscribe_link)
 
         # Determine all recipients (TO + CC)
         all_recipients = [recipient_email] + cc_recipients
@@ -494,12 +559,202 @@ def send_newsletter_with_cc(server, recipient_email, cc_recipients, subject, htm
         return False
 
 
-# --- 7. Main Orchestration Function ---
+async def send_newsletter_with_cc_async(pool, recipient_email, cc_recipients, subject, html_body, unsubscribe_link):
+    """Async variant of send_newsletter_with_cc that sends through an AsyncSMTPPool."""
+    try:
+        msg = build_newsletter_message(recipient_email, cc_recipients, subject, html_body, unsubscribe_link)
+
+        # Determine all recipients (TO + CC)
+        all_recipients = [recipient_email] + cc_recipients
+
+        # Send email
+        await pool.sendmail(EMAIL_ADDRESS, all_recipients, msg.as_string())
+
+        # Log successful send
+        cc_info = f" (CC: {', '.join(cc_recipients)})" if cc_recipients else ""
+        logger.info(f"✅ Newsletter sent successfully to {recipient_email}{cc_info}")
+
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Failed to send email to {recipient_email}. Error: {e}")
+        return False
+
+
+async def deliver_newsletter_async(main_recipients, cc_recipients, subject, static_content, categorized_content,
+                                   concurrency=SMTP_CONCURRENCY):
+    """Sends the campaign over up to `concurrency` concurrent SMTP sessions.
+
+    Recipients are rendered lazily so only `concurrency` messages are held in
+    memory at once. One session is opened before any message is rendered;
+    if it fails the exception propagates and nothing is sent.
+    Returns (successful_sends, failed_sends).
+    """
+    pool = AsyncSMTPPool(
+        concurrency, host=SMTP_HOST, port=SMTP_PORT, timeout=30, starttls=SMTP_STARTTLS,
+        username=EMAIL_ADDRESS if EMAIL_PASSWORD else None, password=EMAIL_PASSWORD,
+        allow_plaintext_auth=SMTP_ALLOW_PLAINTEXT_AUTH,
+    )
+
+    async def deliver(email):
+        html_body, unsubscribe_link = build_recipient_html(email, static_content, categorized_content)
+        return await send_newsletter_with_cc_async(pool, email, cc_recipients, subject, html_body, unsubscribe_link)
+
+    successful_sends = failed_sends = 0
+    pending = set()
+
+    def count(done):
+        nonlocal successful_sends, failed_sends
+        for task in done:
+            if task.result():
+                successful_sends += 1
+            else:
+                failed_sends += 1
+
+    try:
+        await pool.open()
+        logger.info("✅ Connected to SMTP server successfully.")
+
+        for email in main_recipients:
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                count(done)
+            pending.add(asyncio.create_task(deliver(email)))
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            count(done)
+    finally:
+        await pool.close()
+
+    return successful_sends, failed_sends
+
+
+# --- 7. Offline Rendering ---
+
+_render_state = {}
+
+
+def _init_render_worker(static_content, categorized_content, cc_recipients, subject, sender):
+    """Stores the shared campaign content once per worker process."""
+    _render_state.update(static_content=static_content, categorized_content=categorized_content,
+                         cc_recipients=cc_recipients, subject=subject, sender=sender)
+
+
+def _render_message(email):
+    """Renders the complete message for one recipient. Returns (email, message_text)."""
+    html_body, unsubscribe_link = build_recipient_html(
+        email, _render_state['static_content'], _render_state['categorized_content'])
+    msg = build_newsletter_message(email, _render_state['cc_recipients'], _render_state['subject'],
+                                   html_body, unsubscribe_link, _render_state['sender'])
+    return email, msg.as_string()
+
+
+def _render_batch(emails):
+    """Renders a batch of recipients. Returns [(email, message_text), ...]."""
+    return [_render_message(email) for email in emails]
+
+
+def _mbox_entry(message_text):
+    """Formats one message as an mbox entry, escaping body lines that start with 'From '."""
+    body = re.sub(r"^(>*From )", r">\1", message_text, flags=re.MULTILINE)
+    return f"From MAILER-DAEMON {time.asctime(time.gmtime())}\n{body}\n\n"
+
+
+def render_newsletter_offline(output_path, main_recipients, cc_recipients, subject,
+                              static_content, categorized_content, workers=RENDER_WORKERS):
+    """Renders every per-recipient message across a process pool and streams it to disk.
+
+    Messages are written in recipient order, either appended to an mbox file
+    (output_path ends with .mbox) or as one .eml file per recipient.
+    Returns the number of messages written.
+    """
+    to_mbox = output_path.endswith(".mbox")
+    if not to_mbox:
+        os.makedirs(output_path, exist_ok=True)
+
+    sender = EMAIL_ADDRESS
+    if not sender:
+        sender = OFFLINE_PLACEHOLDER_SENDER
+        logger.warning(f"⚠ EMAIL_ADDRESS is not set; rendering with placeholder sender {sender}.")
+
+    rendered = 0
+    start = time.perf_counter()
+    recipients = iter(main_recipients)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                             initargs=(static_content, categorized_content, cc_recipients, subject, sender)) as pool:
+        # Submit in a bounded window rather than all at once (as pool.map does), so
+        # finished messages cannot pile up faster than they are written.
+        window = collections.deque()
+
+        def submit_next():
+            batch = list(itertools.islice(recipients, RENDER_BATCH_SIZE))
+            if batch:
+                window.append(pool.submit(_render_batch, batch))
+
+        for _ in range(workers * RENDER_TASKS_PER_WORKER):
+            submit_next()
+
+        mbox = open(output_path, "w", encoding="utf-8") if to_mbox else None
+        try:
+            while window:
+                messages = window.popleft().result()
+                submit_next()
+                for email, message_text in messages:
+                    if mbox:
+                        mbox.write(_mbox_entry(message_text))
+                    else:
+                        filename = f"{rendered:06d}-{quote(email, safe='@')}.eml"
+                        with open(os.path.join(output_path, filename), "w", encoding="utf-8") as eml:
+                            eml.write(message_text)
+                    rendered += 1
+        except BaseException:
+            for future in window:
+                future.cancel()
+            raise
+        finally:
+            if mbox:
+                mbox.close()
+
+    elapsed = time.perf_counter() - start
+    rate = rendered / elapsed if elapsed else 0
+    logger.info(f"🗂 Rendered {rendered} messages to {output_path} in {elapsed:.2f}s "
+                f"({rate:.0f} msg/s, {workers} workers)")
+    return rendered
+
+
+# --- 8. Main Orchestration Function ---
+def _deliver_newsletter_sync(main_recipients, cc_recipients, subject, static_content, categorized_content):
+    """Sends the campaign over a single smtplib session. Returns (successful_sends, failed_sends)."""
+    # SMTP connection and sending
+    with smtplib.SMTP(SMTP_HOST or "smtp.gmail.com", SMTP_PORT, timeout=30) as server:
+        server.starttls()
+        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        logger.info("✅ Logged into SMTP server successfully.")
+
+        successful_sends = 0
+        failed_sends = 0
+
+        for email in main_recipients:
+            # Generate links and HTML content
+            html_body, unsubscribe_link = build_recipient_html(email, static_content, categorized_content)
+
+            # Send email with CC
+            if send_newsletter_with_cc(server, email, cc_recipients, subject, html_body, unsubscribe_link):
+                successful_sends += 1
+            else:
+                failed_sends += 1
+
+            # Rate limiting
+            time.sleep(1)
+
+    return successful_sends, failed_sends
+
+
 def run_newsletter_campaign():
     """Orchestrates the newsletter creation and sending process with CC functionality."""
     logger.info("🚀 Starting Neo Safe2Eat Newsletter Campaign with CC Support...")
 
-    if not SEND_NEWSLETTER:
+    if not SEND_NEWSLETTER and not OFFLINE_RENDER_PATH:
         logger.info("SEND_NEWSLETTER is set to False in .env file. Exiting campaign.")
         return
 
@@ -533,39 +788,32 @@ def run_newsletter_campaign():
     # Email configuration
     subject = f"Neo Safe2Eat Weekly Newsletter Volume 1 | Week 4"
 
-    try:
-        # SMTP connection and sending
-        with smtplib.SMTP("smtp.gmail.com", 587, timeout=30) as server:
-            server.starttls()
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            logger.info("✅ Logged into SMTP server successfully.")
-
-            successful_sends = 0
-            failed_sends = 0
-
-            for email in main_recipients:
-                # Generate unsubscribe and subscribe links for each recipient
-                unsubscribe_link = f"{APP_DOMAIN}/unsubscribe/{quote(email, safe='')}"
-                subscribe_link = f"{APP_DOMAIN}/subscribe/{quote(email, safe='')}"
-                
-                
-                
-                # Generate HTML content
-                html_body = generate_html_content(static_content, categorized_content, unsubscribe_link, subscribe_link)
-                
-                # Send email with CC
-                if send_newsletter_with_cc(server, email, cc_recipients, subject, html_body, unsubscribe_link):
-                    successful_sends += 1
-                else:
-                    failed_sends += 1
-                
-                # Rate limiting
-                time.sleep(1)
-
-    except Exception as e:
-        logger.error(f"❌ Failed to connect to SMTP server. Error: {e}", exc_info=True)
+    # Offline mode: write every message to disk instead of sending
+    if OFFLINE_RENDER_PATH:
+        render_newsletter_offline(OFFLINE_RENDER_PATH, main_recipients, cc_recipients, subject,
+                                  static_content, categorized_content)
         return
 
+    # Async mode: many concurrent SMTP sessions, no per-message rate limiting
+    if SMTP_DELIVERY_MODE == "async":
+        if not SMTP_HOST:
+            logger.error("❌ SMTP_DELIVERY_MODE=async requires SMTP_HOST to be set. Exiting campaign.")
+            return
+        logger.info(f"⚡ Async delivery to {SMTP_HOST}:{SMTP_PORT} with up to {SMTP_CONCURRENCY} sessions.")
+        try:
+            successful_sends, failed_sends = asyncio.run(deliver_newsletter_async(
+                main_recipients, cc_recipients, subject, static_content, categorized_content))
+        except Exception as e:
+            logger.error(f"❌ Failed to connect to SMTP server. Error: {e}", exc_info=True)
+            return
+    else:
+        try:
+            successful_sends, failed_sends = _deliver_newsletter_sync(
+                main_recipients, cc_recipients, subject, static_content, categorized_content)
+        except Exception as e:
+            logger.error(f"❌ Failed to connect to SMTP server. Error: {e}", exc_info=True)
+            return
+
     # Final summary
     total_unique_recipients = len(main_recipients) + len(cc_recipients)
     logger.info("🎉 Newsletter campaign finished!")
@@ -579,6 +827,6 @@ def run_newsletter_campaign():
     logger.info(f"   - Categories: 4 (Regulatory, Industry, Nutrition, International)")
 
 
-# --- 8. Script Execution ---
+# --- 9. Script Execution ---
 if __name__ == "__main__":
     run_newsletter_campaign()
\ No newline at end of file
@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+import bulk_sync
+from bulk_sync import BulkSyncError, iter_changes
+
+# Small read sizes put read boundaries inside numbers, literals, strings and
+# multi-byte characters; the last one reads the whole body at once.
+READ_SIZES = list(range(1, 9)) + [13, 64 * 1024]
+
+ARRAY_BODIES = [
+    '[]',
+    ' [ ] ',
+    '[1.25]',
+    '[12e3]',
+    '[-0.5E-10, 1e+2, 0, -7]',
+    '[123456789, 98765.4321]',
+    '[true, false, null]',
+    '["a,b", "]", "\\"x\\""]',
+    '[{"email": "a@example.com", "subscribed": true}, {"email": "b@example.com", "subscribed": false}]',
+    '[{"email": "ünï@exämple.com", "subscribed": true, "note": "🎉"}]',
+    '[[1, [2.5]], {"n": {"m": 3e1}}]\n',
+]
+
+NDJSON_BODY = (
+    '{"email": "a@example.com", "subscribed": true}\n'
+    '\n'
+    '{"email": "ü@example.com", "subscribed": false, "score": 12.5e1}\r\n'
+    '{"email": "c@example.com", "subscribed": true}'
+)
+
+
+def parse(body, read_size, monkeypatch):
+    monkeypatch.setattr(bulk_sync, "READ_SIZE", read_size)
+    return list(iter_changes(io.BytesIO(body.encode("utf-8"))))
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+@pytest.mark.parametrize("body", ARRAY_BODIES)
+def test_array_matches_json_loads(body, read_size, monkeypatch):
+    assert parse(body, read_size, monkeypatch) == json.loads(body)
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+def test_ndjson_lines(read_size, monkeypatch):
+    expected = [json.loads(line) for line in NDJSON_BODY.splitlines() if line.strip()]
+    assert parse(NDJSON_BODY, read_size, monkeypatch) == expected
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+def test_ndjson_invalid_line_yields_none(read_size, monkeypatch):
+    body = '{"email": "a@example.com", "subscribed": true}\n{oops}\n[1]\n'
+    assert parse(body, read_size, monkeypatch) == [
+        {"email": "a@example.com", "subscribed": True}, None, [1]]
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+@pytest.mark.parametrize("body", [
+    '[1 2]',
+    '[1,]',
+    '[1.]',
+    '[12e]',
+    '[1',
+    '[1] x',
+    '[tru]',
+])
+def test_invalid_array_raises(body, read_size, monkeypatch):
+    with pytest.raises(BulkSyncError):
+        parse(body, read_size, monkeypatch)
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+def test_invalid_utf8_raises(read_size, monkeypatch):
+    monkeypatch.setattr(bulk_sync, "READ_SIZE", read_size)
+    with pytest.raises(BulkSyncError):
+        list(iter_changes(io.BytesIO(b'[{"email": "\xff@example.com"}]')))
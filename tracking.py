@@ -0,0 +1,205 @@
+# File: tracking.py
+# Description: Open/click tracking helpers. Builds signed tracked links and the
+#              open pixel for the newsletter HTML, and records engagement events
+#              to an append-only log with in-memory counters that are flushed to
+#              the database in periodic batches.
+
+import os
+import time
+import hmac
+import atexit
+import hashlib
+import logging
+import threading
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# --- 1. Configuration ---
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+TRACKING_LOG_PATH = os.getenv("TRACKING_LOG_PATH", os.path.join(basedir, "tracking_events.log"))
+TRACKING_FLUSH_INTERVAL = float(os.getenv("TRACKING_FLUSH_INTERVAL", "5"))
+# Consecutive failed flushes after which a counter is dropped (its events stay in the log).
+TRACKING_FLUSH_ATTEMPTS = int(os.getenv("TRACKING_FLUSH_ATTEMPTS", "5"))
+# Buffered log bytes that trigger a write before the next flush.
+LOG_BUFFER_SIZE = 64 * 1024
+
+EVENT_OPEN = "open"
+EVENT_CLICK = "click"
+
+# 1x1 transparent GIF served for every open, kept in memory.
+PIXEL_GIF = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+    b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+)
+
+
+# --- 2. Link Building and Signing ---
+
+def tracking_secret():
+    """Returns the HMAC key for tracked links, or None when tracking is disabled.
+
+    Read on every call rather than at import, so a TRACKING_SECRET loaded from
+    .env after this module is imported still takes effect.
+    """
+    return os.getenv("TRACKING_SECRET") or None
+
+
+def _sign(message):
+    return hmac.new(tracking_secret().encode(), message.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def article_id(url):
+    """Returns a short, stable identifier for an article URL."""
+    return hashlib.sha1(url.encode()).hexdigest()[:10]
+
+
+def sign_click(campaign, article, recipient, url):
+    """Signs a click target so the redirect endpoint cannot be used as an open redirect."""
+    return _sign(f"{campaign}|{article}|{recipient}|{url}")
+
+
+def verify_click(campaign, article, recipient, url, signature):
+    """Checks a click signature produced by sign_click."""
+    return hmac.compare_digest(sign_click(campaign, article, recipient, url), signature or "")
+
+
+def sign_open(campaign, recipient):
+    """Signs an open pixel so opens cannot be recorded for arbitrary campaigns."""
+    return _sign(f"open|{campaign}|{recipient}")
+
+
+def verify_open(campaign, recipient, signature):
+    """Checks an open pixel signature produced by sign_open."""
+    return hmac.compare_digest(sign_open(campaign, recipient), signature or "")
+
+
+def build_click_link(app_domain, campaign, recipient, url):
+    """Returns the tracked redirect link for one article and recipient."""
+    article = article_id(url)
+    return (
+        f"{app_domain}/t/c/{quote(campaign, safe='')}/{article}/{quote(recipient, safe='')}"
+        f"?u={quote(url, safe='')}&s={sign_click(campaign, article, recipient, url)}"
+    )
+
+
+def build_open_pixel_link(app_domain, campaign, recipient):
+    """Returns the open-tracking pixel URL for one recipient."""
+    return (
+        f"{app_domain}/t/o/{quote(campaign, safe='')}/{quote(recipient, safe='')}.gif"
+        f"?s={sign_open(campaign, recipient)}"
+    )
+
+
+# --- 3. Event Recorder ---
+
+class EventRecorder:
+    """Appends events to a compact log and aggregates per-campaign/per-article counters.
+
+    Recording only takes a lock, buffers a log line and bumps a dict entry. A
+    background thread swaps the counters out every flush interval and hands
+    them to flush_callback as {(campaign, article, event): count}.
+
+    The log is opened with O_APPEND and buffered lines are written with a
+    single os.write, so several worker processes sharing one log file never
+    tear or interleave each other's lines.
+    """
+
+    def __init__(self, log_path=TRACKING_LOG_PATH, flush_interval=TRACKING_FLUSH_INTERVAL,
+                 flush_callback=None, flush_attempts=TRACKING_FLUSH_ATTEMPTS):
+        self.log_path = log_path
+        self.flush_interval = flush_interval
+        self.flush_callback = flush_callback
+        self.flush_attempts = flush_attempts
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._failures = {}
+        self._lines = []
+        self._buffered = 0
+        self._log_fd = None
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        """Opens the log and starts the flusher once per process (safe after fork)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._counts, self._failures = {}, {}
+        self._lines, self._buffered = [], 0
+        self._log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._thread = threading.Thread(target=self._flush_loop, name="tracking-flusher", daemon=True)
+        self._thread.start()
+
+    def _write_lines(self):
+        """Writes the buffered lines in one append. Call with the lock held."""
+        if self._lines:
+            data = "".join(self._lines).encode("utf-8")
+            self._lines, self._buffered = [], 0
+            os.write(self._log_fd, data)
+
+    def record(self, event, campaign, article, recipient):
+        """Records a single open or click event."""
+        key = (campaign, article, event)
+        line = f"{int(time.time())}\t{event}\t{campaign}\t{article}\t{recipient}\n"
+        with self._lock:
+            self._ensure_started()
+            self._lines.append(line)
+            self._buffered += len(line)
+            if self._buffered >= LOG_BUFFER_SIZE:
+                self._write_lines()
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered log lines and passes the pending counters to flush_callback."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            counts, self._counts = self._counts, {}
+            self._write_lines()
+
+        if not counts or self.flush_callback is None:
+            return
+        try:
+            self.flush_callback(counts)
+        except Exception as e:
+            logger.error(f"❌ Failed to flush {len(counts)} tracking counters. Error: {e}")
+            failed = self._flush_each(counts) if len(counts) > 1 else counts
+        else:
+            failed = {}
+        self._requeue(counts, failed)
+
+    def _flush_each(self, counts):
+        """Retries a failed batch one counter at a time. Returns the counters that still fail."""
+        failed = {}
+        for key, value in counts.items():
+            try:
+                self.flush_callback({key: value})
+            except Exception:
+                failed[key] = value
+        return failed
+
+    def _requeue(self, counts, failed):
+        """Puts failed counters back for the next flush, dropping those that keep failing."""
+        with self._lock:
+            for key in counts:
+                if key not in failed:
+                    self._failures.pop(key, None)
+            for key, value in failed.items():
+                attempts = self._failures.get(key, 0) + 1
+                if attempts >= self.flush_attempts:
+                    # A counter the database keeps rejecting (e.g. an oversized campaign
+                    # id) would otherwise be retried forever; its events remain in the log.
+                    self._failures.pop(key, None)
+                    logger.error(f"❌ Dropping tracking counter {key} ({value} events) after {attempts} failed flushes.")
+                    continue
+                self._failures[key] = attempts
+                self._counts[key] = self._counts.get(key, 0) + value